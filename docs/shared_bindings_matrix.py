@@ -21,14 +21,19 @@
 # THE SOFTWARE.
 #
 
+import hashlib
 import json
 import os
 import pathlib
 import re
 import subprocess
+import tempfile
 import tomllib
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from itertools import chain
+from operator import itemgetter
 
 SUPPORTED_PORTS = [
     "analog",
@@ -96,6 +101,19 @@ FROZEN_EXCLUDES = ["examples", "docs", "tests", "utils", "conf.py", "setup.py"]
 """Files and dirs at the root of a frozen directory that should be ignored.
 This is the same list as in the preprocess_frozen_modules script."""
 
+_BOARD_NAME_RE = re.compile(r"(?<=MICROPY_HW_BOARD_NAME)\s+(.+)")
+_MCU_RE = re.compile(r"(?<=MICROPY_HW_MCU_NAME)\s+(.+)")
+_FLASH_RE = re.compile(r"(?<=EXTERNAL_FLASH_DEVICES)\s+=\s+(.+)")
+# Newlines are excluded from the capture classes so that whole-file scans
+# match line by line, exactly like the former per-line search.
+_PIN_RE = re.compile(r"QSTR_([^\)\n]+).+pin_([^\)\n]+)")
+# Matches a whole printed `VAR = value` line (except CFLAGS, whose -D
+# defines are captured individually instead) or a single -DFOO=N define.
+_MAKE_OUTPUT_RE = re.compile(
+    r"^(?!CFLAGS =)([A-Z][A-Z0-9_]*) = (.*)$|-D([A-Z][A-Z0-9_]*)=(\d+)", re.M
+)
+_BOARD_MARKER_RE = re.compile(r"^BOARD = (\S+)$", re.M)
+
 repository_urls = {}
 """Cache of repository URLs for frozen modules."""
 
@@ -107,17 +125,20 @@ def get_circuitpython_root_dir():
     return root_dir
 
 
+def _dirnames(path):
+    """Names of the subdirectories of ``path``, listed with a single scandir
+    pass instead of a stat per entry."""
+    with os.scandir(path) as entries:
+        return [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+
+
 def get_bindings():
     """Get a list of modules in shared-bindings and ports/*/bindings
     based on folder names."""
-    shared_bindings_modules = [
-        module.name
-        for module in (get_circuitpython_root_dir() / "shared-bindings").iterdir()
-        if module.is_dir()
-    ]
+    shared_bindings_modules = _dirnames(get_circuitpython_root_dir() / "shared-bindings")
     bindings_modules = []
     for d in get_circuitpython_root_dir().glob("ports/*/bindings"):
-        bindings_modules.extend(module.name for module in d.iterdir() if d.is_dir())
+        bindings_modules.extend(_dirnames(d))
     return (
         shared_bindings_modules
         + bindings_modules
@@ -133,53 +154,114 @@ def get_board_mapping():
     """
     boards = {}
     for port in SUPPORTED_PORTS:
-        board_path = root_dir / "ports" / port / "boards"
-        # Zephyr port has vendor specific subdirectories to match zephyr (and
-        # clean up the boards folder.)
-        g = "*/*" if port == "zephyr-cp" else "*"
-        for board_path in board_path.glob(g):
-            if board_path.is_dir():
-                board_id = board_path.name
-                if port == "zephyr-cp":
-                    vendor = board_path.parent.name
-                    board_id = f"{vendor}_{board_id}"
-                aliases = ALIASES_BY_BOARD.get(board_path.name, [])
-                boards[board_id] = {
+        boards_dir = f"{root_dir}/ports/{port}/boards"
+        # os.scandir classifies entries from the directory listing itself,
+        # avoiding the per-entry stat that pathlib's glob/is_dir incurs.
+        board_dirs = []
+        with os.scandir(boards_dir) as entries:
+            if port == "zephyr-cp":
+                # Zephyr port has vendor specific subdirectories to match
+                # zephyr (and clean up the boards folder.)
+                vendor_dirs = [
+                    entry.path for entry in entries if entry.is_dir(follow_symlinks=False)
+                ]
+                for vendor_dir in vendor_dirs:
+                    with os.scandir(vendor_dir) as vendor_entries:
+                        board_dirs += [
+                            entry
+                            for entry in vendor_entries
+                            if entry.is_dir(follow_symlinks=False)
+                        ]
+            else:
+                board_dirs = [entry for entry in entries if entry.is_dir(follow_symlinks=False)]
+        for board_dir in board_dirs:
+            board_id = board_dir.name
+            if port == "zephyr-cp":
+                vendor = os.path.basename(os.path.dirname(board_dir.path))
+                board_id = f"{vendor}_{board_id}"
+            aliases = ALIASES_BY_BOARD.get(board_dir.name, [])
+            boards[board_id] = {
+                "port": port,
+                "download_count": 0,
+                "aliases": aliases,
+                "directory": board_dir.path,
+            }
+            for alias in aliases:
+                boards[alias] = {
                     "port": port,
                     "download_count": 0,
-                    "aliases": aliases,
-                    "directory": board_path,
+                    "alias": True,
+                    "aliases": [],
+                    "directory": board_dir.path,
                 }
-                for alias in aliases:
-                    boards[alias] = {
-                        "port": port,
-                        "download_count": 0,
-                        "alias": True,
-                        "aliases": [],
-                        "directory": board_path,
-                    }
     return boards
 
 
-def build_module_map():
-    """Establish the base of the JSON file, based on the contents from
-    `configs`. Base contains the module name and the controlling C macro name.
+@lru_cache(maxsize=None)
+def _module_map_items():
+    """The (module name, controlling C macro name) pairs for every binding,
+    as an immutable tuple. Memoized: the mapping is identical for every
+    board and every call within a run.
     """
-    base = dict()
-    modules = get_bindings()
-    for module in modules:
-        full_name = module
+    # A dict keyed on the module name deduplicates bindings that also appear
+    # in ADDITIONAL_MODULES.
+    items = {}
+    for module in get_bindings():
         if module in ADDITIONAL_MODULES:
             search_identifier = ADDITIONAL_MODULES[module]
         else:
             search_identifier = "CIRCUITPY_" + module.lstrip("_").upper()
+        items[module] = search_identifier
+    return tuple(items.items())
+
+
+MAKEFILE_SETTINGS = [
+    "CFLAGS",
+    "CIRCUITPY_BUILD_EXTENSIONS",
+    "FROZEN_MPY_DIRS",
+    "SRC_PATTERNS",
+    "SRC_SUPERVISOR",
+]
+"""Build settings queried from each board's Makefile.
 
-        base[module] = {
-            "name": full_name,
-            "key": search_identifier,
-        }
+This list must explicitly include any setting queried by tools/ci_set_matrix.py.
+"""
 
-    return base
+
+def _parse_settings_output(output):
+    """Parse the output of the Makefile print-* targets into a settings dict.
+
+    A single multiline scan of the raw output, rather than splitting into
+    lines and regexing each one, which allocates a large intermediate list
+    for CFLAGS-sized lines.
+    """
+    settings = {}
+    for m in _MAKE_OUTPUT_RE.finditer(output):
+        if m.group(1) is not None:
+            settings[m.group(1)] = m.group(2)
+        else:
+            settings[m.group(3)] = m.group(4)
+    return settings
+
+
+_settings_cache = {}
+"""Cache of makefile settings keyed on (port_dir, board config digest)."""
+
+
+def _board_config_digest(port_dir, board_name):
+    """Digest of a board's mpconfigboard files. Boards in a family that
+    share them derive the same makefile settings, so the digest can key a
+    settings cache. Returns None when the files cannot be read (the board
+    is then always queried directly).
+    """
+    try:
+        with open(f"{port_dir}/boards/{board_name}/mpconfigboard.mk", "rb") as f:
+            mk_bytes = f.read()
+        with open(f"{port_dir}/boards/{board_name}/mpconfigboard.h", "rb") as f:
+            h_bytes = f.read()
+    except OSError:
+        return None
+    return hashlib.blake2b(mk_bytes + h_bytes, digest_size=16).digest()
 
 
 def get_settings_from_makefile(port_dir, board_name):
@@ -187,27 +269,35 @@ def get_settings_from_makefile(port_dir, board_name):
 
     This means that the effect of all Makefile directives is taken
     into account, without having to re-encode the logic that sets them
-    in this script, something that has proved error-prone
-
-    This list must explicitly include any setting queried by tools/ci_set_matrix.py.
+    in this script, something that has proved error-prone. (For the same
+    reason, resolving the variables in Python from a ``make -p`` database
+    dump is not an option: board selection happens while make parses
+    ``boards/$(BOARD)/mpconfigboard.mk``, so the dumped database already has
+    one board's includes and conditionals baked in.)
+
+    ``-r`` skips make's builtin implicit rules, which cuts the no-op
+    invocation roughly tenfold without affecting any printed setting.
     """
     if os.getenv("NO_BINDINGS_MATRIX"):
         return {"CIRCUITPY_BUILD_EXTENSIONS": ".bin"}
 
+    digest = _board_config_digest(port_dir, board_name)
+    if digest is not None and (port_dir, digest) in _settings_cache:
+        # Copy: callers mutate the returned dict (e.g. build_release_files
+        # rewrites CIRCUITPY_BUILD_EXTENSIONS in place).
+        return dict(_settings_cache[(port_dir, digest)])
+
     contents = subprocess.run(
         [
             "make",
+            "-r",
             "-C",
             port_dir,
             "-f",
             "Makefile",
             f"BOARD={board_name}",
-            "print-CFLAGS",
-            "print-CIRCUITPY_BUILD_EXTENSIONS",
-            "print-FROZEN_MPY_DIRS",
-            "print-SRC_PATTERNS",
-            "print-SRC_SUPERVISOR",
-        ],
+        ]
+        + [f"print-{setting}" for setting in MAKEFILE_SETTINGS],
         encoding="utf-8",
         errors="replace",
         stdout=subprocess.PIPE,
@@ -221,20 +311,117 @@ def get_settings_from_makefile(port_dir, board_name):
         )
         raise RuntimeError(error_msg)
 
-    settings = {}
-    for line in contents.stdout.split("\n"):
-        if line.startswith("CFLAGS ="):
-            for m in re.findall(r"-D([A-Z][A-Z0-9_]*)=(\d+)", line):
-                settings[m[0]] = m[1]
-        elif m := re.match(r"^([A-Z][A-Z0-9_]*) = (.*)$", line):
-            settings[m.group(1)] = m.group(2)
-
+    settings = _parse_settings_output(contents.stdout)
+    if digest is not None:
+        _settings_cache[(port_dir, digest)] = dict(settings)
     return settings
 
 
+def batch_settings_for_port(port_dir, board_names):
+    """Invoke make once per port to print the critical build settings of
+    every board in it, returning a dict of settings keyed by board name.
+
+    Board selection happens while make parses ``boards/$(BOARD)/mpconfigboard.mk``,
+    so a single parse cannot evaluate several boards; instead a generated
+    meta-Makefile drives one quiet sub-make per board. This launches a single
+    process from Python per port (instead of one per board) and lets make's
+    jobserver run the sub-makes in parallel, with ``--output-sync`` keeping
+    each board's output contiguous.
+
+    Boards whose mpconfigboard files hash identically share one make query
+    through the settings cache.
+    """
+    if os.getenv("NO_BINDINGS_MATRIX"):
+        return {board: {"CIRCUITPY_BUILD_EXTENSIONS": ".bin"} for board in board_names}
+
+    settings_by_board = {}
+    digests = {}
+    representatives = {}
+    to_query = []
+    for board in board_names:
+        digest = _board_config_digest(port_dir, board)
+        if digest is None:
+            to_query.append(board)
+            continue
+        key = (port_dir, digest)
+        digests[board] = key
+        if key in _settings_cache:
+            # Copy: callers mutate the returned dicts, and same-digest boards
+            # must not share one.
+            settings_by_board[board] = dict(_settings_cache[key])
+        elif key not in representatives:
+            representatives[key] = board
+            to_query.append(board)
+    if to_query:
+        queried = _query_port_settings(port_dir, to_query)
+        for board, settings in queried.items():
+            settings_by_board[board] = settings
+            if board in digests:
+                _settings_cache[digests[board]] = dict(settings)
+        # Boards that deferred to a same-digest representative.
+        for board in board_names:
+            if board not in settings_by_board and board in digests:
+                settings_by_board[board] = dict(_settings_cache[digests[board]])
+    return settings_by_board
+
+
+def _query_port_settings(port_dir, board_names):
+    """Run the batched per-port make for the given boards and parse the
+    printed settings per board.
+    """
+    print_targets = " ".join(f"print-{setting}" for setting in MAKEFILE_SETTINGS)
+    # Intentionally not $(MAKE): the sub-makes must not share the parent's
+    # jobserver so that --output-sync buffers each board as a single block.
+    meta_makefile = (
+        "SUBMAKE := make\n"
+        "all: $(BOARDS)\n"
+        ".PHONY: all $(BOARDS)\n"
+        "$(BOARDS):\n"
+        f'\t@$(SUBMAKE) -s -r --no-print-directory -C "{port_dir}" -f Makefile -j1'
+        f" BOARD=$@ print-BOARD {print_targets}\n"
+    )
+    with tempfile.NamedTemporaryFile("w", suffix=".mk", prefix="bindings_matrix_") as f:
+        f.write(meta_makefile)
+        f.flush()
+        contents = subprocess.run(
+            [
+                "make",
+                "-r",
+                "-f",
+                f.name,
+                f"-j{os.cpu_count()}",
+                "--output-sync=target",
+                f"BOARDS={' '.join(board_names)}",
+                "all",
+            ],
+            encoding="utf-8",
+            errors="replace",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    # Make signals errors with exit status 2; 0 and 1 are "non-error" statuses
+    if contents.returncode not in (0, 1):
+        # GNU make before 4.0 (such as the stock macOS make) rejects
+        # --output-sync, so retry one board at a time; a genuine board error
+        # then surfaces with the per-board invocation in the message.
+        return {board: get_settings_from_makefile(port_dir, board) for board in board_names}
+
+    # Each board's section opens with its print-BOARD line; split on those
+    # markers and parse each section.
+    parts = _BOARD_MARKER_RE.split(contents.stdout)
+    return {parts[i]: _parse_settings_output(parts[i + 1]) for i in range(1, len(parts), 2)}
+
+
 def get_repository_url(directory):
+    directory = str(directory)
     if directory in repository_urls:
         return repository_urls[directory]
+    # Sibling frozen directories under the same repository share a README
+    # (and a git checkout), so cache the URL under every key that resolves
+    # to it: the directory asked about, the README's directory, and the git
+    # top-level. That way the README is parsed (or git invoked) only once
+    # per repository, not once per board.
+    cache_keys = {directory}
     readme = None
     for readme_path in (
         os.path.join(directory, "README.rst"),
@@ -245,17 +432,33 @@ def get_repository_url(directory):
             break
     path = None
     if readme:
-        with open(readme, "r") as fp:
-            for line in fp.readlines():
-                if m := re.match(
-                    r"\s+:target:\s+(http\S+(docs.circuitpython|readthedocs)\S+)\s*",
-                    line,
-                ):
-                    path = m.group(1)
-                    break
-                if m := re.search(r"<(http[^>]+)>", line):
-                    path = m.group(1)
-                    break
+        readme_dir = os.path.dirname(readme)
+        cache_keys.add(readme_dir)
+        if readme_dir in repository_urls:
+            path = repository_urls[readme_dir]
+        else:
+            with open(readme, "r") as fp:
+                for line in fp.readlines():
+                    if m := re.match(
+                        r"\s+:target:\s+(http\S+(docs.circuitpython|readthedocs)\S+)\s*",
+                        line,
+                    ):
+                        path = m.group(1)
+                        break
+                    if m := re.search(r"<(http[^>]+)>", line):
+                        path = m.group(1)
+                        break
+    if path is None:
+        toplevel = subprocess.run(
+            ["git", "-C", directory, "rev-parse", "--show-toplevel"],
+            encoding="utf-8",
+            errors="replace",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ).stdout.strip()
+        if toplevel:
+            cache_keys.add(toplevel)
+            path = repository_urls.get(toplevel)
     if path is None:
         contents = subprocess.run(
             ["git", "remote", "get-url", "origin"],
@@ -266,7 +469,8 @@ def get_repository_url(directory):
             cwd=directory,
         )
         path = contents.stdout.strip()
-    repository_urls[directory] = path
+    for key in cache_keys:
+        repository_urls[key] = path
     return path
 
 
@@ -276,6 +480,26 @@ def remove_prefix(s, prefix):
     return s.removeprefix(prefix)
 
 
+def _contains_py_file(path):
+    """Whether any python file exists under ``path``, short-circuiting on the
+    first one found rather than walking the whole tree like a recursive glob.
+    """
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".py"):
+                    return True
+    return False
+
+
+@lru_cache(maxsize=None)
 def frozen_modules_from_dirs(frozen_mpy_dirs, withurl):
     """
     Go through the list of frozen directories and extract the python modules.
@@ -284,39 +508,52 @@ def frozen_modules_from_dirs(frozen_mpy_dirs, withurl):
         $(TOP)/frozen/circuitpython-stage/meowbit
     Python modules are at the root of the path, and are python files or directories
     containing python files. Except the ones in the FROZEN_EXCLUDES list.
+
+    Many boards share the same FROZEN_MPY_DIRS value, so results are
+    memoized (and therefore returned as a tuple) to avoid re-walking
+    identical directory sets.
     """
     frozen_modules = []
     for frozen_path in filter(lambda x: x, frozen_mpy_dirs.split(" ")):
         frozen_path = remove_prefix(frozen_path, "../../")
         source_dir = get_circuitpython_root_dir() / frozen_path
         url_repository = get_repository_url(source_dir)
-        for sub in source_dir.glob("*"):
-            if sub.name in FROZEN_EXCLUDES:
-                continue
-            if sub.name.endswith(".py"):
-                if withurl:
-                    frozen_modules.append((sub.name[:-3], url_repository))
-                else:
-                    frozen_modules.append(sub.name[:-3])
-                continue
-            if next(sub.glob("**/*.py"), None):  # tests if not empty
-                if withurl:
-                    frozen_modules.append((sub.name, url_repository))
-                else:
-                    frozen_modules.append(sub.name)
-    return frozen_modules
+        try:
+            entries = os.scandir(source_dir)
+        except FileNotFoundError:  # not-checked-out submodules have no modules
+            continue
+        with entries:
+            for sub in entries:
+                if sub.name in FROZEN_EXCLUDES:
+                    continue
+                if sub.name.endswith(".py"):
+                    if withurl:
+                        frozen_modules.append((sub.name[:-3], url_repository))
+                    else:
+                        frozen_modules.append(sub.name[:-3])
+                    continue
+                if _contains_py_file(sub.path):
+                    if withurl:
+                        frozen_modules.append((sub.name, url_repository))
+                    else:
+                        frozen_modules.append(sub.name)
+    return tuple(frozen_modules)
 
 
-def lookup_setting(settings, key, default=""):
-    while True:
-        value = settings.get(key, default)
-        if not value.startswith("$"):
-            break
-        key = value[2:-1]
-    return value
+_worker_module_keys = None
 
 
-def support_matrix_by_board(
+def _init_worker(module_keys):
+    """Stash the shared module-key table in a worker-process global so the
+    tasks themselves stay tiny (a board id and its info dict).
+    """
+    global _worker_module_keys
+    _worker_module_keys = module_keys
+
+
+def support_matrix(
+    arg,
+    module_keys=None,
     use_branded_name=True,
     withurl=True,
     add_port=False,
@@ -324,162 +561,216 @@ def support_matrix_by_board(
     add_pins=False,
     add_branded_name=False,
 ):
-    """Compiles a list of the available core modules available for each
-    board.
+    """Compute the matrix entries for a single board.
+
+    ``arg`` is a ``(board_id, board_info)`` pair whose ``board_info`` carries
+    the settings pre-fetched by `batch_settings_for_port`; ``module_keys``
+    is the ``(module name, setting key)`` sequence from `_module_map_items`,
+    taken from the table installed by `_init_worker` when not given.
+    Everything passed in must be picklable so the work can be farmed out
+    to worker processes.
     """
-    base = build_module_map()
-
-    def support_matrix(arg):
-        board_id, board_info = arg
-        port = board_info["port"]
-        board_directory = board_info["directory"]
-        port_dir = board_directory.parent.parent
-        if port != "zephyr-cp":
-            settings = get_settings_from_makefile(str(port_dir), board_directory.name)
-            autogen_board_info = None
-        else:
-            circuitpython_toml_fn = board_directory / "circuitpython.toml"
-            with circuitpython_toml_fn.open("rb") as f:
-                settings = tomllib.load(f)
-
-            autogen_board_info_fn = board_directory / "autogen_board_info.toml"
-            with autogen_board_info_fn.open("rb") as f:
-                autogen_board_info = tomllib.load(f)
+    if module_keys is None:
+        module_keys = _worker_module_keys
+    board_id, board_info = arg
+    port = board_info["port"]
+    # Plain string paths: building a PosixPath per file access is
+    # measurable overhead at this call rate.
+    board_directory = board_info["directory"]
+    if port != "zephyr-cp":
+        settings = board_info["settings"]
+        autogen_board_info = None
+    else:
+        # Read each file in one shot instead of letting tomllib chunk
+        # through a file object.
+        with open(f"{board_directory}/circuitpython.toml", encoding="utf-8") as f:
+            settings = tomllib.loads(f.read())
+
+        with open(f"{board_directory}/autogen_board_info.toml", encoding="utf-8") as f:
+            autogen_board_info = tomllib.loads(f.read())
+
+    # Board files are only opened when a requested flag needs them:
+    # mpconfigboard.h for names or chips, mpconfigboard.mk for chips, and
+    # pins.c for pins. mpconfigboard.h is read at most once and every regex
+    # that needs it runs on the cached contents.
+    h_contents = None
+    needs_board_h = add_chips or (
+        (use_branded_name or add_branded_name) and not autogen_board_info
+    )
+    if needs_board_h:
+        with open(f"{board_directory}/mpconfigboard.h") as f:
+            h_contents = f.read()
 
-        if use_branded_name or add_branded_name:
-            if autogen_board_info:
-                branded_name = autogen_board_info["name"]
-            else:
-                with open(board_directory / "mpconfigboard.h") as get_name:
-                    board_contents = get_name.read()
-                board_name_re = re.search(r"(?<=MICROPY_HW_BOARD_NAME)\s+(.+)", board_contents)
-                if board_name_re:
-                    branded_name = board_name_re.group(1).strip('"')
-                    if '"' in branded_name:  # sometimes the closing " is not at line end
-                        branded_name = branded_name[: branded_name.index('"')]
-                    board_name = branded_name
-
-        if use_branded_name:
-            board_name = branded_name
+    if use_branded_name or add_branded_name:
+        if autogen_board_info:
+            branded_name = autogen_board_info["name"]
         else:
-            board_name = board_id
-
-        if add_chips:
-            with open(board_directory / "mpconfigboard.h") as get_name:
-                board_contents = get_name.read()
-            mcu_re = re.search(r"(?<=MICROPY_HW_MCU_NAME)\s+(.+)", board_contents)
-            if mcu_re:
-                mcu = mcu_re.group(1).strip('"')
-                if '"' in mcu:  # in case the closing " is not at line end
-                    mcu = mcu[: mcu.index('"')]
-            else:
-                mcu = ""
-            with open(board_directory / "mpconfigboard.mk") as get_name:
-                board_contents = get_name.read()
-            flash_re = re.search(r"(?<=EXTERNAL_FLASH_DEVICES)\s+=\s+(.+)", board_contents)
-            if flash_re:
-                # deal with the variability in the way multiple flash chips
-                # are denoted.  We want them to end up as a quoted,
-                # comma separated string
-                flash = flash_re.group(1).replace('"', "")
-                flash = f'"{flash}"'
-            else:
-                flash = ""
+            board_name_re = _BOARD_NAME_RE.search(h_contents)
+            if board_name_re:
+                branded_name = board_name_re.group(1).strip('"')
+                if '"' in branded_name:  # sometimes the closing " is not at line end
+                    branded_name = branded_name[: branded_name.index('"')]
+
+    if use_branded_name:
+        board_name = branded_name
+    else:
+        board_name = board_id
+
+    if add_chips:
+        mcu_re = _MCU_RE.search(h_contents)
+        if mcu_re:
+            mcu = mcu_re.group(1).strip('"')
+            if '"' in mcu:  # in case the closing " is not at line end
+                mcu = mcu[: mcu.index('"')]
+        else:
+            mcu = ""
+        with open(f"{board_directory}/mpconfigboard.mk") as f:
+            mk_contents = f.read()
+        flash_re = _FLASH_RE.search(mk_contents)
+        if flash_re:
+            # deal with the variability in the way multiple flash chips
+            # are denoted.  We want them to end up as a quoted,
+            # comma separated string
+            flash = flash_re.group(1).replace('"', "")
+            flash = f'"{flash}"'
+        else:
+            flash = ""
 
-        if add_pins:
+    if add_pins:
+        try:
+            with open(f"{board_directory}/pins.c") as f:
+                pins_contents = f.read()
+        except FileNotFoundError:  # silabs boards have no pins.c
             pins = []
-            try:
-                with open(board_directory / "pins.c") as get_name:
-                    pin_lines = get_name.readlines()
-            except FileNotFoundError:  # silabs boards have no pins.c
-                pass
-            else:
-                for p in pin_lines:
-                    pin_re = re.search(r"QSTR_([^\)]+).+pin_([^\)]+)", p)
-                    if pin_re:
-                        board_pin = pin_re.group(1)
-                        chip_pin = pin_re.group(2)
-                        pins.append((board_pin, chip_pin))
-
-        board_modules = []
-        if autogen_board_info:
-            autogen_modules = autogen_board_info["modules"]
-            for k in autogen_modules:
-                if autogen_modules[k]:
-                    board_modules.append(k)
-        else:
-            for module in base:
-                key = base[module]["key"]
-                if int(lookup_setting(settings, key, "0")):
-                    board_modules.append(base[module]["name"])
-        board_modules.sort()
-
-        if "CIRCUITPY_BUILD_EXTENSIONS" in settings:
-            board_extensions = settings["CIRCUITPY_BUILD_EXTENSIONS"]
-            if isinstance(board_extensions, str):
-                board_extensions = [extension.strip() for extension in board_extensions.split(",")]
         else:
-            raise OSError(f"Board extensions undefined: {board_name}.")
-
-        frozen_modules = []
-        if "FROZEN_MPY_DIRS" in settings:
-            frozen_modules = frozen_modules_from_dirs(settings["FROZEN_MPY_DIRS"], withurl)
-            if frozen_modules:
-                frozen_modules.sort()
-
-        # generate alias boards too
-
-        board_info = {
-            "modules": board_modules,
-            "frozen_libraries": frozen_modules,
-            "extensions": board_extensions,
-        }
-        if add_branded_name:
-            board_info["branded_name"] = branded_name
-        if add_port:
-            board_info["port"] = port
-        if add_chips:
-            board_info["mcu"] = mcu
-            board_info["flash"] = flash
-        if add_pins:
-            board_info["pins"] = pins
-        board_matrix = [(board_name, board_info)]
-        if board_id in ALIASES_BY_BOARD:
-            for alias in ALIASES_BY_BOARD[board_id]:
-                if use_branded_name:
-                    if alias in ALIASES_BRAND_NAMES:
-                        alias = ALIASES_BRAND_NAMES[alias]
-                    else:
-                        alias = alias.replace("_", " ").title()
-                board_info = {
-                    "modules": board_modules,
-                    "frozen_libraries": frozen_modules,
-                    "extensions": board_extensions,
-                }
-                if add_branded_name:
-                    board_info["branded_name"] = branded_name
-                if add_port:
-                    board_info["port"] = port
-                if add_chips:
-                    board_info["mcu"] = mcu
-                    board_info["flash"] = flash
-                if add_pins:
-                    board_info["pins"] = pins
-                board_matrix.append((alias, board_info))
-
-        return board_matrix  # this is now a list of (board,modules)
+            # One regex pass over the whole file yields every
+            # (board_pin, chip_pin) tuple.
+            pins = _PIN_RE.findall(pins_contents)
+
+    board_modules = []
+    if autogen_board_info:
+        autogen_modules = autogen_board_info["modules"]
+        for k in autogen_modules:
+            if autogen_modules[k]:
+                board_modules.append(k)
+    else:
+        # Flatten the $(...) indirections in one pass over the settings,
+        # then test each module key against the resolved table instead of
+        # re-chasing the chain per module.
+        resolved = {}
+        for key, value in settings.items():
+            while value.startswith("$"):
+                value = settings.get(value[2:-1], "0")
+            resolved[key] = value
+        for name, key in module_keys:
+            if int(resolved.get(key, "0")):
+                board_modules.append(name)
+    board_modules.sort()
+
+    if "CIRCUITPY_BUILD_EXTENSIONS" in settings:
+        board_extensions = settings["CIRCUITPY_BUILD_EXTENSIONS"]
+        if isinstance(board_extensions, str):
+            board_extensions = [extension.strip() for extension in board_extensions.split(",")]
+    else:
+        raise OSError(f"Board extensions undefined: {board_name}.")
 
+    frozen_modules = []
+    if "FROZEN_MPY_DIRS" in settings:
+        frozen_modules = list(frozen_modules_from_dirs(settings["FROZEN_MPY_DIRS"], withurl))
+        if frozen_modules:
+            frozen_modules.sort()
+
+    # generate alias boards too
+
+    board_info = {
+        "modules": board_modules,
+        "frozen_libraries": frozen_modules,
+        "extensions": board_extensions,
+    }
+    if add_branded_name:
+        board_info["branded_name"] = branded_name
+    if add_port:
+        board_info["port"] = port
+    if add_chips:
+        board_info["mcu"] = mcu
+        board_info["flash"] = flash
+    if add_pins:
+        board_info["pins"] = pins
+    board_matrix = [(board_name, board_info)]
+    if board_id in ALIASES_BY_BOARD:
+        for alias in ALIASES_BY_BOARD[board_id]:
+            if use_branded_name:
+                if alias in ALIASES_BRAND_NAMES:
+                    alias = ALIASES_BRAND_NAMES[alias]
+                else:
+                    alias = alias.replace("_", " ").title()
+            # Alias boards carry exactly the same payload as their primary
+            # board, so share the dict instead of rebuilding it per alias.
+            board_matrix.append((alias, board_info))
+
+    return board_matrix  # this is now a list of (board,modules)
+
+
+def support_matrix_by_board(
+    use_branded_name=True,
+    withurl=True,
+    add_port=False,
+    add_chips=False,
+    add_pins=False,
+    add_branded_name=False,
+):
+    """Compiles a list of the available core modules available for each
+    board.
+    """
+    module_keys = _module_map_items()
     board_mapping = get_board_mapping()
     real_boards = []
     for board in board_mapping:
         if not board_mapping[board].get("alias", False):
             real_boards.append((board, board_mapping[board]))
-    executor = ThreadPoolExecutor(max_workers=os.cpu_count())
-    mapped_exec = executor.map(support_matrix, real_boards)
-    # flatmap with comprehensions
-    boards = dict(
-        sorted([board for matrix in mapped_exec for board in matrix], key=lambda x: x[0])
+
+    # Pre-fetch the Makefile settings with one batched make per port, so the
+    # per-board pass never has to spawn a subprocess. Zephyr boards read
+    # their settings from TOML instead of make.
+    board_names_by_port = {}
+    for board_id, board_info in real_boards:
+        if board_info["port"] != "zephyr-cp":
+            board_names_by_port.setdefault(board_info["port"], []).append(
+                os.path.basename(board_info["directory"])
+            )
+    settings_by_port = {
+        port: batch_settings_for_port(str(root_dir / "ports" / port), board_names)
+        for port, board_names in board_names_by_port.items()
+    }
+    for board_id, board_info in real_boards:
+        if board_info["port"] != "zephyr-cp":
+            board_info["settings"] = settings_by_port[board_info["port"]][
+                os.path.basename(board_info["directory"])
+            ]
+
+    # The remaining per-board work (regexes, TOML parsing, file reads) is
+    # CPU-bound Python, so use processes rather than GIL-bound threads.
+    board_matrix = partial(
+        support_matrix,
+        use_branded_name=use_branded_name,
+        withurl=withurl,
+        add_port=add_port,
+        add_chips=add_chips,
+        add_pins=add_pins,
+        add_branded_name=add_branded_name,
     )
+    # Size chunks so each worker sees a few batches, keeping the pool busy
+    # without paying pickling overhead per board.
+    chunksize = max(1, len(real_boards) // (os.cpu_count() * 4))
+    with ProcessPoolExecutor(
+        max_workers=os.cpu_count(), initializer=_init_worker, initargs=(module_keys,)
+    ) as executor:
+        mapped_exec = executor.map(board_matrix, real_boards, chunksize=chunksize)
+        # Flatten, sort by board name with a C-implemented key, and build
+        # the dict directly from the sorted pairs.
+        all_boards = list(chain.from_iterable(mapped_exec))
+        all_boards.sort(key=itemgetter(0))
+        boards = dict(all_boards)
 
     return boards
 